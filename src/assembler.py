@@ -8,9 +8,15 @@ import pyparsing as pp
 from loguru import logger
 from pyparsing import *
 
-from memory import Byte
 from src import data
 
+try:
+    from memory import Byte
+    from peephole import Peephole
+except ImportError:
+    from .memory import Byte
+    from .peephole import Peephole
+
 
 @attr.s
 class Assembler:
@@ -19,8 +25,9 @@ class Assembler:
     file_start: int = attr.ib(init=False, default=0)
     file_end: int = attr.ib(init=False, default=0)
     file_len: int = attr.ib(init=False, default=0)
-    symbols_table: Dict = attr.ib(init=False, default={})
-    tokens: List = attr.ib(repr=False, init=False, default=[])
+    symbols_table: Dict = attr.ib(init=False, factory=dict)
+    tokens: List = attr.ib(repr=False, init=False, factory=list)
+    end_index: int = attr.ib(repr=False, init=False, default=None)
 
     def __attrs_post_init__(self):
         self.keywords = Assembler.make_keywords_parser()
@@ -73,6 +80,8 @@ class Assembler:
 
     def assign_end(self, token):
         self.file_end = self.file_start + self.file_len
+        # step_one appends this line's tokens right after parsing it
+        self.end_index = len(self.tokens)
         return ["0", f"{self.file_start:03X}"]
 
     def make_pseudo_parser(self):
@@ -137,7 +146,10 @@ class Assembler:
                     )
                 self.tokens.append(res)
 
-    def step_two(self):
+    def optimize(self, self_modifying=(), drop_result_stores=False):
+        return Peephole(self, self_modifying, drop_result_stores).run()
+
+    def encode(self) -> bytearray:
         # print(self.tokens)
         partial_result = []  # opcodes with symbols substituted by their addresses
         for token in self.tokens:
@@ -171,8 +183,10 @@ class Assembler:
                 result.append(int(word, 16))
         checksum = Byte(sum(result[:-2])).unsigned
         result.insert(3, checksum)
-        result = bytearray(result)
+        return bytearray(result)
 
+    def step_two(self):
+        result = self.encode()
         # path = Path(__file__).resolve().parent.joinpath("data/program.bin")
         with importlib.resources.path(data, "program.bin") as path, open(
             path, "wb"
@@ -191,8 +205,27 @@ if __name__ == "__main__":
             required=False,
             default=path,
         )
+    parser.add_argument(
+        "-O",
+        "--optimize",
+        action="store_true",
+        help="run the peephole optimiser between the two passes",
+    )
+    parser.add_argument(
+        "--self-modifying",
+        nargs="*",
+        default=[],
+        help="symbols whose code region must not be optimised",
+    )
+    parser.add_argument(
+        "--drop-result-stores",
+        action="store_true",
+        help="also remove stores to constants the program never reads",
+    )
     args = parser.parse_args()
 
     ass = Assembler(args.file)
     ass.step_one()
+    if args.optimize:
+        ass.optimize(args.self_modifying, args.drop_result_stores)
     ass.step_two()
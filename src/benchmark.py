@@ -0,0 +1,82 @@
+import argparse
+import importlib.resources
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+from loguru import logger
+
+from src import data
+
+try:
+    from assembler import Assembler
+    from counters import Counters
+    from cpu import CPU
+    from memory import Byte, Memory
+except ImportError:
+    from .assembler import Assembler
+    from .counters import Counters
+    from .cpu import CPU
+    from .memory import Byte, Memory
+
+
+def assemble(path: Path, optimize: bool = False) -> bytearray:
+    assembler = Assembler(path)
+    assembler.step_one()
+    if optimize:
+        assembler.optimize()
+    return assembler.encode()
+
+
+def count_instructions(image: bytes, max_steps: int = 100000) -> int:
+    # The body is placed at its start address directly, so the loader's own
+    # instructions are not part of the count
+    start = image[0] * 0x100 + image[1]
+    memory = Memory()
+    for idx, byte in enumerate(image[4:-2]):
+        memory[start + idx] = Byte(byte)
+    cpu = CPU(memory, counters=Counters())
+    cpu.PC = start
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # PD appends to output.txt in the working directory
+        os.chdir(tmp)
+        try:
+            while cpu.counters.instructions < max_steps:
+                cpu.step()
+        except SystemExit:
+            # The OS 0 that stopped the machine is not counted as retired
+            return cpu.counters.instructions
+        finally:
+            os.chdir(cwd)
+    raise RuntimeError(f"Program did not finish within {max_steps} instructions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="programs to run with and without the peephole pass",
+    )
+    parser.add_argument("--max-steps", type=int, default=100000)
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    files = args.files
+    if not files:
+        with importlib.resources.path(data, "fibonacci.asm") as fibonacci:
+            files.append(fibonacci)
+        with importlib.resources.path(data, "benchmark.asm") as benchmark:
+            files.append(benchmark)
+
+    for path in files:
+        before = count_instructions(assemble(path), args.max_steps)
+        after = count_instructions(assemble(path, optimize=True), args.max_steps)
+        print(
+            f"{Path(path).name}: {before} instructions, {after} with -O "
+            f"({before - after} saved)"
+        )
@@ -0,0 +1,78 @@
+from typing import Dict, List, Sequence, Tuple
+
+import attr
+import numpy as np
+
+try:
+    from memory import BOOT_IMAGE, BYTES, MEMORY_SIZE, Memory
+except ImportError:
+    from .memory import BOOT_IMAGE, BYTES, MEMORY_SIZE, Memory
+
+# program.bin layout, as written by Assembler.step_two:
+# start address (2 bytes), length, checksum, body, trailing end word (2 bytes)
+HEADER_SIZE = 4
+TRAILER_SIZE = 2
+
+
+@attr.s(frozen=True)
+class LoadedProgram:
+
+    memory: Memory = attr.ib(repr=False)
+    start: int = attr.ib()
+    length: int = attr.ib()
+
+
+def verify_images(images: Sequence[bytes]) -> np.ndarray:
+    # Checks every header and checksum at once over the concatenated images
+    # and returns a boolean array with one entry per image.
+    count = len(images)
+    if count == 0:
+        return np.zeros(0, dtype=bool)
+    sizes = np.fromiter(map(len, images), dtype=np.int64, count=count)
+    flat = np.frombuffer(b"".join(images), dtype=np.uint8)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    # prefix[i] is the sum of flat[:i]
+    prefix = np.concatenate(([0], np.cumsum(flat, dtype=np.int64)))
+
+    valid = sizes >= HEADER_SIZE + TRAILER_SIZE
+    # Short images read their header from index 0 and are masked out anyway
+    base = np.where(valid, offsets, 0)
+    padded = np.concatenate((flat, np.zeros(HEADER_SIZE, dtype=np.uint8)))
+    start = padded[base].astype(np.int64) * 0x100 + padded[base + 1]
+    length = padded[base + 2].astype(np.int64)
+    checksum = padded[base + 3].astype(np.int64)
+
+    valid &= sizes == HEADER_SIZE + length + TRAILER_SIZE
+    valid &= start + length <= MEMORY_SIZE
+    end = np.where(valid, offsets + sizes - TRAILER_SIZE, base)
+    total = prefix[end] - prefix[base] - checksum
+    valid &= (total & 0xFF) == checksum
+    return valid
+
+
+def load_images(
+    images: Sequence[bytes], banks: int = 1, template: Tuple = BOOT_IMAGE
+) -> List[LoadedProgram]:
+    # Every machine shares the Byte objects of the loader prefix and of its
+    # program; identical images are only converted once.
+    valid = verify_images(images)
+    if not valid.all():
+        bad = np.flatnonzero(~valid).tolist()
+        raise ValueError(f"Images {bad} have an invalid header or checksum")
+    if len(template) != MEMORY_SIZE:
+        raise ValueError
+
+    prepared: Dict[bytes, Tuple[Tuple, int, int]] = {}
+    loaded = []
+    for image in images:
+        image = bytes(image)
+        if image not in prepared:
+            start = image[0] * 0x100 + image[1]
+            length = image[2]
+            body = image[HEADER_SIZE : HEADER_SIZE + length]
+            program = list(template)
+            program[start : start + length] = [BYTES[byte] for byte in body]
+            prepared[image] = (tuple(program), start, length)
+        program, start, length = prepared[image]
+        loaded.append(LoadedProgram(Memory(banks, program), start, length))
+    return loaded
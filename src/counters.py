@@ -0,0 +1,138 @@
+from typing import Dict, List
+
+import attr
+
+MNEMONICS = "JP JZ JN LV + - * / LD MM SC RS HM GD PD OS".split()
+# Data accesses made by each opcode, instruction fetches excluded
+READS = {0x4: 1, 0x5: 1, 0x6: 1, 0x7: 1, 0x8: 1, 0xB: 2}
+WRITES = {0x9: 1, 0xA: 2}
+# Counter numbers used by OS /2cb, in order
+GUEST_COUNTERS = [
+    "instructions",
+    "memory_reads",
+    "memory_writes",
+    "bytes_in",
+    "bytes_out",
+    "call_depth",
+    "max_call_depth",
+    "return_hits",
+    "return_misses",
+]
+
+
+@attr.s
+class Counters:
+
+    instructions: int = attr.ib(default=0)
+    opcodes: List[int] = attr.ib(factory=lambda: [0] * 16)
+    memory_reads: int = attr.ib(default=0)
+    memory_writes: int = attr.ib(default=0)
+    bytes_in: int = attr.ib(default=0)
+    bytes_out: int = attr.ib(default=0)
+    call_depth: int = attr.ib(default=0)
+    max_call_depth: int = attr.ib(default=0)
+    # Returns predicted by the CPU's shadow return stack, and fallbacks
+    return_hits: int = attr.ib(default=0)
+    return_misses: int = attr.ib(default=0)
+    latched: Dict[int, int] = attr.ib(factory=dict, repr=False)
+
+    def retire(self, opcode: int):
+        self.instructions += 1
+        self.opcodes[opcode] += 1
+        self.memory_reads += READS.get(opcode, 0)
+        self.memory_writes += WRITES.get(opcode, 0)
+        if opcode == 0xD:
+            self.bytes_in += 1
+        elif opcode == 0xE:
+            self.bytes_out += 1
+        elif opcode == 0xA:
+            self.call_depth += 1
+            self.max_call_depth = max(self.max_call_depth, self.call_depth)
+        elif opcode == 0xB and self.call_depth > 0:
+            self.call_depth -= 1
+
+    def read_byte(self, arg: int) -> int:
+        # OS /2cb reads byte b of counter c, OS /3ob byte b of the count for
+        # opcode o. Reading byte 0 latches the value so that the higher bytes
+        # read afterwards belong to the same snapshot.
+        group, index, byte = arg >> 8, (arg >> 4) & 0xF, arg & 0xF
+        key = arg & 0xFF0
+        if byte == 0 or key not in self.latched:
+            if group == 0x2:
+                if index >= len(GUEST_COUNTERS):
+                    raise NotImplementedError
+                self.latched[key] = getattr(self, GUEST_COUNTERS[index])
+            else:
+                self.latched[key] = self.opcodes[index]
+        return (self.latched[key] >> (8 * byte)) & 0xFF
+
+    def as_dict(self) -> Dict[str, int]:
+        metrics = {name: getattr(self, name) for name in GUEST_COUNTERS}
+        for opcode, count in enumerate(self.opcodes):
+            metrics[f"opcode_{MNEMONICS[opcode]}"] = count
+        return metrics
+
+    def prometheus(self, prefix: str = "vm") -> str:
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP {prefix}_{name} {help}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{prefix}_{name}{labels} {value}")
+
+        metric(
+            "instructions_retired_total",
+            "counter",
+            "Instructions executed to completion",
+            [("", self.instructions)],
+        )
+        metric(
+            "opcode_retired_total",
+            "counter",
+            "Instructions executed to completion, per opcode",
+            [
+                (f'{{opcode="{MNEMONICS[opcode]}"}}', count)
+                for opcode, count in enumerate(self.opcodes)
+            ],
+        )
+        metric(
+            "memory_reads_total",
+            "counter",
+            "Data reads from memory",
+            [("", self.memory_reads)],
+        )
+        metric(
+            "memory_writes_total",
+            "counter",
+            "Data writes to memory",
+            [("", self.memory_writes)],
+        )
+        metric(
+            "input_bytes_total", "counter", "Bytes read by GD", [("", self.bytes_in)]
+        )
+        metric(
+            "output_bytes_total",
+            "counter",
+            "Bytes written by PD",
+            [("", self.bytes_out)],
+        )
+        metric(
+            "call_depth", "gauge", "Current subroutine depth", [("", self.call_depth)]
+        )
+        metric(
+            "max_call_depth",
+            "gauge",
+            "Deepest subroutine nesting seen",
+            [("", self.max_call_depth)],
+        )
+        metric(
+            "shadow_returns_total",
+            "counter",
+            "Returns resolved through the shadow return stack",
+            [
+                ('{result="hit"}', self.return_hits),
+                ('{result="miss"}', self.return_misses),
+            ],
+        )
+        return "\n".join(lines) + "\n"
@@ -1,4 +1,10 @@
-from typing import Callable, Dict
+import argparse
+import mmap
+import os
+from collections import deque
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Deque, Dict, Tuple
 
 import attr
 from loguru import logger
@@ -8,10 +14,14 @@ import importlib.resources
 from src import data
 
 try:
+    from counters import Counters
     from memory import Byte, Memory, Word
 except ImportError:
+    from .counters import Counters
     from .memory import Byte, Memory, Word
 
+SHADOW_STACK_SIZE = 256
+
 
 @attr.s
 class CPU:
@@ -27,6 +37,29 @@ class CPU:
     )
     opcode: Dict[int, Callable] = attr.ib(default=None, init=False, repr=False)
     read_offset: int = attr.ib(default=0, init=False, repr=False)
+    input_path: Path = attr.ib(default=None, repr=False)
+    output_path: Path = attr.ib(default=Path("output.txt"), repr=False)
+    mapped_io: bool = attr.ib(default=False, repr=False)
+    binary_output_path: Path = attr.ib(default=Path("output.bin"), repr=False)
+    output_capacity: int = attr.ib(default=0x10000, repr=False)
+    write_offset: int = attr.ib(default=0, init=False, repr=False)
+    output_base: int = attr.ib(default=0, init=False, repr=False)
+    _input_map: mmap.mmap = attr.ib(default=None, init=False, repr=False)
+    _output_map: mmap.mmap = attr.ib(default=None, init=False, repr=False)
+    counters: Counters = attr.ib(default=None, repr=False)
+    # Where close() writes the counters in Prometheus text format
+    metrics_path: Path = attr.ib(default=None, repr=False)
+    shadow_stack: bool = attr.ib(default=False, repr=False)
+    # (subroutine address, return address) for every SC not yet returned from
+    return_stack: Deque[Tuple[int, int]] = attr.ib(
+        factory=lambda: deque(maxlen=SHADOW_STACK_SIZE), init=False, repr=False
+    )
+
+    @output_capacity.validator
+    def check_output_capacity(self, attribute, value):
+        # write_mapped grows the mapping by at least this much at a time
+        if value <= 0:
+            raise ValueError(f"{attribute.name} must be positive, got {value}")
 
     def __attrs_post_init__(self):
         self.opcode = {
@@ -94,6 +127,13 @@ class CPU:
         logger.debug(f"Argument: {arg} == /{arg:03X}")
         return function, arg
 
+    def step(self):
+        self.fetch()
+        function, arg = self.decode()
+        function(arg)
+        if self.counters is not None:
+            self.counters.retire(self.instruction.first_byte.first_nibble)
+
     def jmp(self, arg):
         logger.debug(f"Setting PC to {arg}")
         self.PC = arg
@@ -153,13 +193,37 @@ class CPU:
         self.memory[arg] = self.AC
 
     def subroutine_call(self, arg):
+        return_address = self.PC & 0xFFF
         self.memory[arg] = Byte((self.PC & 0xF00) >> 8)
         self.memory[arg + 1] = Byte(self.PC & 0x0FF)
         self.PC = arg + 2
+        if self.shadow_stack:
+            self.return_stack.append((arg, return_address))
         logger.debug(f"Storing current PC in memory positions {arg} and {arg+1}")
         logger.debug(f"Current PC is now {self.PC}")
 
+    def predict_return(self, arg):
+        # The prediction only holds if the bytes SC wrote are still there,
+        # otherwise the guest changed its return address and RS decodes it.
+        hit = False
+        if self.return_stack and self.return_stack[-1][0] == arg:
+            _, address = self.return_stack.pop()
+            hit = (
+                self.memory[arg].unsigned == address >> 8
+                and self.memory[arg + 1].unsigned == address & 0xFF
+            )
+            if hit:
+                self.PC = address
+        if self.counters is not None:
+            if hit:
+                self.counters.return_hits += 1
+            else:
+                self.counters.return_misses += 1
+        return hit
+
     def return_from_subroutine(self, arg):
+        if self.shadow_stack and self.predict_return(arg):
+            return
         first_byte = format(self.memory[arg], "x")
         second_byte = format(self.memory[arg + 1], "x")
         if self.memory[arg] > 0xF:
@@ -178,33 +242,126 @@ class CPU:
         input("System halted. Press Enter to resume operations.")
         self.PC = arg
 
+    def input_file(self):
+        if self.input_path is not None:
+            return nullcontext(self.input_path)
+        return importlib.resources.path(data, "program.bin")
+
+    def read_mapped(self, offset):
+        if self._input_map is None:
+            with self.input_file() as path, open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self._input_map = b""
+                else:
+                    self._input_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if offset < len(self._input_map):
+            return self._input_map[offset]
+        return 0
+
+    def write_mapped(self, value):
+        # Like the text output, bytes are appended after whatever the file
+        # already holds; the mapping covers the old contents plus the
+        # preallocated space, which close() trims again.
+        if self._output_map is None:
+            path = Path(self.binary_output_path)
+            self.output_base = path.stat().st_size if path.exists() else 0
+        end = self.output_base + self.write_offset
+        if self._output_map is None or end == len(self._output_map):
+            size = self.output_base + max(self.output_capacity, 2 * self.write_offset)
+            if self._output_map is not None:
+                self._output_map.close()
+            with open(self.binary_output_path, "a+b") as f:
+                f.truncate(size)
+                self._output_map = mmap.mmap(f.fileno(), size)
+            logger.debug(f"Output mapping is now {size} bytes")
+        self._output_map[end] = value
+        self.write_offset += 1
+
+    def close(self):
+        # Trims the preallocated output file down to what was actually written
+        if self._output_map is not None:
+            self._output_map.close()
+            self._output_map = None
+            os.truncate(self.binary_output_path, self.output_base + self.write_offset)
+            self.write_offset = 0
+        if isinstance(self._input_map, mmap.mmap):
+            self._input_map.close()
+        self._input_map = None
+        if self.counters is not None and self.metrics_path is not None:
+            Path(self.metrics_path).write_text(self.counters.prometheus())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def get_data(self, _=None):
-        with importlib.resources.path(data, "program.bin") as path, open(
-            path, "rb"
-        ) as f:
-            f.seek(self.memory.read_offset)
-            file_data = int.from_bytes(f.read(1), "big")
-            self.AC = Byte(file_data)
+        if self.mapped_io:
+            self.AC = Byte(self.read_mapped(self.memory.read_offset))
+        else:
+            with self.input_file() as path, open(path, "rb") as f:
+                f.seek(self.memory.read_offset)
+                file_data = int.from_bytes(f.read(1), "big")
+                self.AC = Byte(file_data)
         self.memory.read_offset += 1
         logger.debug(f"setting AC to {self.AC}")
         logger.debug(f"read_offset: {self.memory.read_offset}")
 
     def put_data(self, _=None):
         logger.debug(f"writing {self.AC} to the output file")
-        with open("output.txt", "a") as f:
+        if self.mapped_io:
+            self.write_mapped(self.AC.unsigned)
+            return
+        with open(self.output_path, "a") as f:
             f.write(str(self.AC.unsigned))
             f.write("\n")
 
     def os_call(self, arg):
         if arg == 0:
+            self.close()
             sys.exit(0)
+        if arg & 0xF00 == 0x100:
+            logger.debug(f"Switching to memory bank {arg & 0xFF}")
+            self.memory.switch_bank(arg & 0xFF)
+            return
+        if arg & 0xE00 == 0x200 and self.counters is not None:
+            self.AC = self.counters.read_byte(arg)
+            logger.debug(f"Read counter byte /{arg:03X}: {self.AC}")
+            return
         raise NotImplementedError
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--mapped-io",
+        action="store_true",
+        help="read GD input through mmap and write PD output as bytes to output.bin",
+    )
+    parser.add_argument(
+        "--shadow-stack",
+        action="store_true",
+        help="predict RS return addresses from a stack of recent SC calls",
+    )
+    parser.add_argument(
+        "--counters",
+        nargs="?",
+        const="metrics.prom",
+        metavar="PATH",
+        help="count executed instructions and write them in Prometheus format "
+        "to PATH (default metrics.prom) on exit",
+    )
+    args = parser.parse_args()
+
     mem = Memory()
-    cpu = CPU(mem, trace=False)
-    while True:
-        cpu.fetch()
-        foo, arg = cpu.decode()
-        foo(arg)
+    with CPU(
+        mem,
+        trace=False,
+        mapped_io=args.mapped_io,
+        shadow_stack=args.shadow_stack,
+        counters=None if args.counters is None else Counters(),
+        metrics_path=args.counters,
+    ) as cpu:
+        while True:
+            cpu.step()
@@ -0,0 +1,25 @@
+@ /F00
+;; Prints the running sum of COUNT - 1 down to 0. Written the way a naive
+;; compiler would, with every result stored and loaded back and jumps to jumps.
+LOOP
+        LD COUNT
+        - ONE
+        MM COUNT
+        LD COUNT
+        JZ DONE
+        LD TOTAL
+        + COUNT
+        MM TOTAL
+        LD TOTAL
+        PD 0
+        JP NEXT
+NEXT
+        JP LOOP
+DONE
+        JP FINISH
+FINISH
+        OS 0
+COUNT    K 20
+TOTAL    K 0
+ONE      K 1
+#
@@ -0,0 +1,354 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import attr
+from loguru import logger
+
+try:
+    from cpu import CPU
+    from fastcpu import FastCPU
+    from memory import BANK_END, BANK_START, MEMORY_SIZE, Memory
+except ImportError:
+    from .cpu import CPU
+    from .fastcpu import FastCPU
+    from .memory import BANK_END, BANK_START, MEMORY_SIZE, Memory
+
+CODE_START = 0x100
+SCRATCH_SIZE = 16
+# HM waits for user input, so it is never generated
+OPCODES = [op for op in range(0x10) if op != 0xC]
+
+
+def encode(opcode: int, arg: int) -> int:
+    # CPU.decode reads the low byte of the argument as a signed value
+    if arg & 0x80:
+        arg += 0x100
+    return (opcode << 12) | (arg & 0xFFF)
+
+
+@attr.s(frozen=True)
+class Program:
+
+    words: Tuple[int, ...] = attr.ib(converter=tuple)
+    data: bytes = attr.ib(converter=bytes, default=b"")
+    scratch: bytes = attr.ib(converter=bytes, default=bytes(SCRATCH_SIZE))
+    banks: int = attr.ib(default=1)
+
+    @property
+    def scratch_start(self) -> int:
+        return CODE_START + 2 * len(self.words)
+
+    def image(self) -> bytes:
+        image = bytearray(MEMORY_SIZE)
+        for idx, word in enumerate(self.words):
+            image[CODE_START + 2 * idx] = word >> 8
+            image[CODE_START + 2 * idx + 1] = word & 0xFF
+        image[self.scratch_start : self.scratch_start + len(self.scratch)] = (
+            self.scratch
+        )
+        return bytes(image)
+
+    def nop(self, idx: int) -> int:
+        return encode(0x0, CODE_START + 2 * idx + 2)
+
+    def size(self) -> Tuple[int, int, int, int]:
+        active = sum(word != self.nop(idx) for idx, word in enumerate(self.words))
+        return (
+            len(self.words),
+            active,
+            len(self.data),
+            sum(map(bool, self.data + self.scratch)),
+        )
+
+    def __str__(self):
+        code = " ".join(f"{word:04X}" for word in self.words)
+        return (
+            f"code: {code} | scratch: {self.scratch.hex()} | data: {self.data.hex()}"
+            f" | banks: {self.banks}"
+        )
+
+
+@attr.s(frozen=True)
+class Outcome:
+
+    status: str = attr.ib()
+    steps: int = attr.ib()
+    PC: int = attr.ib()
+    AC: int = attr.ib()
+    read_offset: int = attr.ib()
+    bank: int = attr.ib()
+    # Common memory followed by every bank, active or not
+    memory: bytes = attr.ib(repr=False)
+    output: str = attr.ib(repr=False)
+
+
+@attr.s
+class Divergence:
+
+    program: Program = attr.ib()
+    outcomes: Dict[str, Outcome] = attr.ib()
+    seed: Optional[int] = attr.ib(default=None)
+
+
+def generate(rng: random.Random, max_length: int = 32) -> Program:
+    length = rng.randint(1, max_length)
+    scratch_start = CODE_START + 2 * length
+    words = []
+    calls = []
+    for _ in range(length):
+        opcode = rng.choice(OPCODES)
+        if opcode == 0xA and rng.random() < 0.5:
+            # A subroutine inside the code: its first word is the return slot
+            arg = CODE_START + 2 * rng.randrange(length)
+            calls.append(arg)
+        elif opcode == 0xB and calls and rng.random() < 0.8:
+            arg = rng.choice(calls)
+        elif opcode in {0x0, 0x1, 0x2}:
+            arg = CODE_START + 2 * rng.randint(0, length)
+        elif opcode == 0x3:
+            arg = rng.randrange(0x100)
+        elif opcode in {0xD, 0xE}:
+            arg = 0
+        elif opcode == 0xF:
+            arg = rng.choice([0, 0, 0, 1, 0x100, 0x101, 0x102])
+        elif rng.random() < 0.9:
+            arg = scratch_start + rng.randrange(SCRATCH_SIZE - 1)
+        elif rng.random() < 0.5:
+            # Occasionally touch the code itself
+            arg = CODE_START + rng.randrange(2 * length)
+        else:
+            # or the banked window and the common memory above it
+            arg = rng.randrange(BANK_START, MEMORY_SIZE)
+        words.append(encode(opcode, arg))
+    data = bytes(rng.randrange(0x100) for _ in range(rng.randint(0, 16)))
+    scratch = bytes(rng.randrange(0x100) for _ in range(SCRATCH_SIZE))
+    return Program(words, data, scratch, rng.randint(1, 3))
+
+
+def reference_snapshot(memory: Memory) -> bytes:
+    snapshot = bytearray(byte.unsigned for byte in memory.memory)
+    for bank in memory.banks[1:]:
+        snapshot += bank
+    return bytes(snapshot)
+
+
+def fast_snapshot(cpu: FastCPU) -> bytes:
+    # Same layout as reference_snapshot: memory as seen with bank 0 active
+    banks = list(cpu.banks)
+    banks[cpu.bank] = cpu.memory[BANK_START:BANK_END]
+    memory = list(cpu.memory)
+    memory[BANK_START:BANK_END] = banks[0]
+    snapshot = bytearray(byte & 0xFF for byte in memory)
+    for bank in banks[1:]:
+        snapshot += bytes(byte & 0xFF for byte in bank)
+    return bytes(snapshot)
+
+
+def run_reference(
+    program: Program,
+    max_steps: int,
+    mapped_io: bool = False,
+    shadow_stack: bool = False,
+) -> Outcome:
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = Path(tmp, "data.bin")
+        input_path.write_bytes(program.data)
+        output_path = Path(tmp, "output.txt")
+        binary_output_path = Path(tmp, "output.bin")
+        with CPU(
+            Memory.from_list(program.image(), program.banks),
+            input_path=input_path,
+            output_path=output_path,
+            mapped_io=mapped_io,
+            binary_output_path=binary_output_path,
+            shadow_stack=shadow_stack,
+        ) as cpu:
+            cpu.memory.read_offset = 0
+            cpu.PC = CODE_START
+            status, steps = "running", 0
+            try:
+                while steps < max_steps:
+                    cpu.step()
+                    steps += 1
+            except SystemExit:
+                status = "exit"
+            except Exception as e:
+                status = type(e).__name__
+        output = output_path.read_text() if output_path.exists() else ""
+        if binary_output_path.exists():
+            output = "".join(f"{byte}\n" for byte in binary_output_path.read_bytes())
+
+    return Outcome(
+        status,
+        steps,
+        cpu.PC,
+        cpu.AC.value,
+        cpu.memory.read_offset,
+        cpu.memory.bank,
+        reference_snapshot(cpu.memory),
+        output,
+    )
+
+
+def run_mapped(program: Program, max_steps: int) -> Outcome:
+    return run_reference(program, max_steps, mapped_io=True)
+
+
+def run_shadow(program: Program, max_steps: int) -> Outcome:
+    return run_reference(program, max_steps, shadow_stack=True)
+
+
+def run_fast(program: Program, max_steps: int) -> Outcome:
+    cpu = FastCPU.from_image(program.image(), program.data, CODE_START, program.banks)
+    status, steps = "running", 0
+    try:
+        while steps < max_steps:
+            cpu.step()
+            steps += 1
+    except SystemExit:
+        status = "exit"
+    except Exception as e:
+        status = type(e).__name__
+
+    return Outcome(
+        status,
+        steps,
+        cpu.PC,
+        cpu.AC,
+        cpu.read_offset,
+        cpu.bank,
+        fast_snapshot(cpu),
+        "".join(cpu.output),
+    )
+
+
+ENGINES: Dict[str, Callable[[Program, int], Outcome]] = {
+    "reference": run_reference,
+    "fast": run_fast,
+    "mapped": run_mapped,
+    "shadow": run_shadow,
+}
+
+
+def compare(
+    program: Program, engines: List[str], max_steps: int
+) -> Optional[Divergence]:
+    outcomes = {name: ENGINES[name](program, max_steps) for name in engines}
+    if len(set(outcomes.values())) > 1:
+        return Divergence(program, outcomes)
+    return None
+
+
+def shrink(divergence: Divergence, engines: List[str], max_steps: int) -> Divergence:
+    # Greedy reduction: keep any simpler candidate that still diverges
+    def candidates(program: Program):
+        words, data, scratch = list(program.words), program.data, program.scratch
+        for cut in (len(words) // 2, len(words) - 1):
+            if 0 < cut < len(words):
+                yield attr.evolve(program, words=words[:cut])
+        for idx, word in enumerate(words):
+            if word != program.nop(idx):
+                yield attr.evolve(
+                    program, words=words[:idx] + [program.nop(idx)] + words[idx + 1 :]
+                )
+        if data:
+            yield attr.evolve(program, data=data[: len(data) // 2])
+            yield attr.evolve(program, data=data[:-1])
+        for idx, byte in enumerate(data):
+            if byte:
+                yield attr.evolve(program, data=data[:idx] + b"\0" + data[idx + 1 :])
+        for idx, byte in enumerate(scratch):
+            if byte:
+                yield attr.evolve(
+                    program, scratch=scratch[:idx] + b"\0" + scratch[idx + 1 :]
+                )
+
+    improved = True
+    while improved:
+        improved = False
+        for candidate in candidates(divergence.program):
+            if candidate.size() >= divergence.program.size():
+                continue
+            result = compare(candidate, engines, max_steps)
+            if result is not None:
+                result.seed = divergence.seed
+                divergence = result
+                improved = True
+                break
+    return divergence
+
+
+def check_seed(
+    seed: int, engines: List[str], max_steps: int, max_length: int
+) -> Optional[Divergence]:
+    program = generate(random.Random(seed), max_length)
+    divergence = compare(program, engines, max_steps)
+    if divergence is None:
+        return None
+    divergence.seed = seed
+    return shrink(divergence, engines, max_steps)
+
+
+def isolate_worker():
+    # HM prompts on stdout and blocks on stdin; inside a worker it reads EOF
+    # instead, identically for every engine.
+    logger.remove()
+    sys.stdin = open(os.devnull)
+    sys.stdout = open(os.devnull, "w")
+
+
+def check_many(
+    seeds: range,
+    engines: List[str],
+    max_steps: int = 200,
+    max_length: int = 32,
+    workers: Optional[int] = None,
+) -> List[Divergence]:
+    with ProcessPoolExecutor(workers, initializer=isolate_worker) as pool:
+        results = pool.map(
+            check_seed,
+            seeds,
+            [engines] * len(seeds),
+            [max_steps] * len(seeds),
+            [max_length] * len(seeds),
+            chunksize=max(1, len(seeds) // (4 * (workers or 8))),
+        )
+        return [divergence for divergence in results if divergence is not None]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--programs", type=int, default=10000)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ENGINES,
+        default="fast",
+        help="engine checked against the reference",
+    )
+    parser.add_argument("--max-steps", type=int, default=200)
+    parser.add_argument("--max-length", type=int, default=32)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seeds = range(args.seed, args.seed + args.programs)
+    divergences = check_many(
+        seeds, ["reference", args.engine], args.max_steps, args.max_length, args.workers
+    )
+    elapsed = time.perf_counter() - start
+    print(f"Checked {args.programs} programs in {elapsed:.1f}s")
+    for divergence in divergences:
+        print(f"seed {divergence.seed}: {divergence.program}")
+        for name, outcome in divergence.outcomes.items():
+            print(f"    {name}: {outcome}")
+    if divergences:
+        raise SystemExit(1)
@@ -0,0 +1,115 @@
+import sys
+from typing import List
+
+import attr
+
+try:
+    from memory import BANK_END, BANK_SIZE, BANK_START, MEMORY_SIZE
+except ImportError:
+    from .memory import BANK_END, BANK_SIZE, BANK_START, MEMORY_SIZE
+
+
+def wrap(value: int) -> int:
+    # Same truncation c_int8 applies inside Byte
+    return ((value + 0x80) & 0xFF) - 0x80
+
+
+@attr.s
+class FastCPU:
+    # Integer-only engine with the same semantics as CPU: memory holds signed
+    # ints instead of Byte objects and nothing is logged.
+
+    memory: List[int] = attr.ib(repr=False)
+    data: bytes = attr.ib(default=b"", repr=False)
+    PC: int = attr.ib(default=0)
+    AC: int = attr.ib(default=0)
+    read_offset: int = attr.ib(default=0, repr=False)
+    output: List[str] = attr.ib(factory=list, repr=False)
+    # Inactive banks are parked here; the active one lives in memory
+    banks: List[List[int]] = attr.ib(factory=lambda: [None], repr=False)
+    bank: int = attr.ib(default=0)
+
+    @classmethod
+    def from_image(
+        cls, image: bytes, data: bytes = b"", PC: int = 0, banks: int = 1
+    ) -> "FastCPU":
+        if len(image) != MEMORY_SIZE:
+            raise ValueError
+        return cls(
+            [wrap(i) for i in image],
+            data,
+            PC,
+            banks=[None] + [[0] * BANK_SIZE for _ in range(banks - 1)],
+        )
+
+    def switch_bank(self, bank: int):
+        if not 0 <= bank < len(self.banks):
+            raise IndexError
+        self.banks[self.bank] = self.memory[BANK_START:BANK_END]
+        self.memory[BANK_START:BANK_END] = self.banks[bank]
+        self.bank = bank
+
+    def set_pc(self, value: int):
+        if (value < 0) or (value > MEMORY_SIZE):
+            raise IndexError
+        self.PC = value
+
+    def step(self):
+        memory = self.memory
+        PC = self.PC
+        if PC + 2 > MEMORY_SIZE:
+            # CPU.fetch cannot build a Word from less than two bytes
+            raise TypeError
+        first = memory[PC] & 0xFF
+        arg = (first & 0x0F) * 0x100 + memory[PC + 1]
+        opcode = first >> 4
+        PC += 2
+        self.PC = PC
+
+        if opcode == 0x0:
+            self.set_pc(arg)
+        elif opcode == 0x1:
+            if self.AC == 0:
+                self.set_pc(arg)
+        elif opcode == 0x2:
+            if self.AC < 0:
+                self.set_pc(arg)
+        elif opcode == 0x3:
+            self.AC = wrap(arg)
+        elif opcode == 0x4:
+            self.AC = wrap(self.AC + memory[arg])
+        elif opcode == 0x5:
+            self.AC = wrap(self.AC - memory[arg])
+        elif opcode == 0x6:
+            self.AC = wrap(self.AC * memory[arg])
+        elif opcode == 0x7:
+            if memory[arg] == 0:
+                raise ZeroDivisionError
+            self.AC = wrap(self.AC // memory[arg])
+        elif opcode == 0x8:
+            self.AC = memory[arg]
+        elif opcode == 0x9:
+            memory[arg] = self.AC
+        elif opcode == 0xA:
+            memory[arg] = (PC & 0xF00) >> 8
+            memory[arg + 1] = wrap(PC & 0x0FF)
+            self.set_pc(arg + 2)
+        elif opcode == 0xB:
+            if memory[arg] > 0xF:
+                raise OverflowError
+            self.set_pc((memory[arg] & 0xFF) * 0x100 + (memory[arg + 1] & 0xFF))
+        elif opcode == 0xC:
+            input("System halted. Press Enter to resume operations.")
+            self.set_pc(arg)
+        elif opcode == 0xD:
+            offset = self.read_offset
+            self.AC = wrap(self.data[offset]) if offset < len(self.data) else 0
+            self.read_offset += 1
+        elif opcode == 0xE:
+            self.output.append(f"{self.AC & 0xFF}\n")
+        elif arg == 0:
+            sys.exit(0)
+        elif arg & 0xF00 == 0x100:
+            self.switch_bank(arg & 0xFF)
+        else:
+            raise NotImplementedError
@@ -136,29 +136,95 @@ class Word:
         return f"Word({self.first_byte.first_nibble:X}{self.first_byte.second_nibble:X}{self.second_byte.first_nibble:X}{self.second_byte.second_nibble:X})"
 
 
+MEMORY_SIZE = 4096
+# BANK_START to BANK_END is a window onto the active bank. The loader below
+# it and programs at the usual /F00 origin above it are common to all banks,
+# so code there keeps running across a switch.
+BANK_START = 0x800
+BANK_END = 0xF00
+BANK_SIZE = BANK_END - BANK_START
+
+# Byte objects are never mutated in place, so every Memory can share these
+BYTES = tuple(Byte(value) for value in range(0x100))
+BOOT_IMAGE = tuple(BYTES[byte] for byte in loader[4:]) + (BYTES[0],) * (
+    MEMORY_SIZE - len(loader[4:])
+)
+
+
 class Memory:
-    def __init__(self):
-        self.memory = [Byte(0)] * 4096
-        for idx, byte in enumerate(loader[4:]):
-            self.memory[idx] = Byte(byte)
+    def __init__(self, banks=1, template=BOOT_IMAGE):
+        # Only the list of references is copied; a write replaces an entry
+        # and leaves the shared template untouched
+        self.memory = list(template)
         self.read_offset = 0
+        # Bank 0 lives in self.memory itself, the others are raw buffers
+        self.banks = [None]
+        self.bank = 0
+        for _ in range(banks - 1):
+            self.add_bank()
 
     @classmethod
-    def from_list(cls, data):
-        if len(data) != 4096:
+    def from_list(cls, data, banks=1):
+        if len(data) != MEMORY_SIZE:
             raise ValueError
-        instance = cls()
-        instance.memory = [Byte(i) for i in data]
-        return instance
+        return cls(banks, template=[BYTES[i & 0xFF] for i in data])
+
+    def add_bank(self, data=None) -> int:
+        if data is None:
+            data = bytearray(BANK_SIZE)
+        if len(data) != BANK_SIZE:
+            raise ValueError(f"A bank must be {BANK_SIZE} bytes long")
+        self.banks.append(data)
+        return len(self.banks) - 1
+
+    def map_banks(self, buffer) -> range:
+        # Splits a large writable buffer (bytearray, mmap) into banks without
+        # copying it; only a trailing partial bank is copied and padded.
+        view = memoryview(buffer).cast("B")
+        first = len(self.banks)
+        for start in range(0, len(view), BANK_SIZE):
+            chunk = view[start : start + BANK_SIZE]
+            if len(chunk) < BANK_SIZE:
+                chunk = bytearray(chunk) + bytearray(BANK_SIZE - len(chunk))
+            self.add_bank(chunk)
+        return range(first, len(self.banks))
+
+    def switch_bank(self, bank):
+        if not 0 <= bank < len(self.banks):
+            raise IndexError(f"Bank {bank} does not exist")
+        self.bank = bank
 
     def __getitem__(self, slice: slice):
-        return self.memory[slice]
+        if self.bank == 0:
+            return self.memory[slice]
+        if type(slice) is not int:
+            return [self[idx] for idx in range(*slice.indices(MEMORY_SIZE))]
+        key = slice + MEMORY_SIZE if slice < 0 else slice
+        if BANK_START <= key < BANK_END:
+            return BYTES[self.banks[self.bank][key - BANK_START]]
+        return self.memory[key]
 
     def __setitem__(self, key, val):
-        self.memory[key] = val
+        if self.bank == 0:
+            self.memory[key] = val
+            return
+        if type(key) is not int:
+            indices = range(*key.indices(MEMORY_SIZE))
+            values = list(val)
+            if len(values) != len(indices):
+                raise ValueError("Slice assignment cannot change the memory size")
+            for idx, value in zip(indices, values):
+                self[idx] = value
+            return
+        key = key + MEMORY_SIZE if key < 0 else key
+        if BANK_START <= key < BANK_END:
+            value = val.unsigned if type(val) is Byte else val & 0xFF
+            self.banks[self.bank][key - BANK_START] = value
+        else:
+            self.memory[key] = val
 
     def __iter__(self):
-        return iter(self.memory)
+        return iter(self.memory if self.bank == 0 else self[:])
 
     def __len__(self):
         return len(self.memory)
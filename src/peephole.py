@@ -0,0 +1,283 @@
+from typing import Dict, List, Optional, Set
+
+import attr
+from loguru import logger
+
+# Opcodes as emitted by Assembler.make_keywords_parser
+JP, JZ, JN, LV = "0", "1", "2", "3"
+LD, MM, SC, HM = "8", "9", "A", "C"
+GD, PD, OS = "D", "E", "F"
+
+JUMPS = {JP, JZ, JN}
+# Opcodes that may transfer control to their argument
+CONTROL = {JP, JZ, JN, SC, HM}
+# Opcodes whose argument is not a memory address
+IMMEDIATE = {LV, GD, PD, OS}
+
+
+def is_label(token) -> bool:
+    return len(token) == 1
+
+
+def is_instruction(token) -> bool:
+    return len(token) == 2
+
+
+def is_constant(token) -> bool:
+    return len(token) == 3
+
+
+def is_terminator(token) -> bool:
+    # Only JP and OS 0 never fall through; the other OS calls return
+    return token[0] == JP or token == [OS, "000"]
+
+
+def is_symbolic(arg: str) -> bool:
+    # Same rule step_two uses to tell numeric arguments and symbols apart
+    try:
+        int(arg, 16)
+    except ValueError:
+        return True
+    return False
+
+
+@attr.s
+class Peephole:
+
+    assembler = attr.ib()
+    self_modifying: Set[str] = attr.ib(factory=set, converter=set)
+    # Stores to constants the program never reads again still leave results
+    # in memory for the host, so dropping them has to be asked for.
+    drop_result_stores: bool = attr.ib(default=False)
+    report: Dict[str, int] = attr.ib(init=False, factory=dict)
+    frozen: Set[int] = attr.ib(init=False, factory=set, repr=False)
+
+    @property
+    def tokens(self) -> List[List[str]]:
+        return self.assembler.tokens
+
+    @property
+    def body(self) -> range:
+        # Everything before the "0 <start>" word emitted by the `#` directive,
+        # which looks like a JP but must never be rewritten.
+        if self.assembler.end_index is None:
+            return range(len(self.tokens))
+        return range(self.assembler.end_index)
+
+    def run(self) -> Dict[str, int]:
+        self.report = {
+            "redundant_load": 0,
+            "jump_threading": 0,
+            "jump_to_next": 0,
+            "dead_store": 0,
+        }
+        if self.uses_absolute_addresses():
+            logger.warning(
+                "Program uses numeric addresses inside its own image, skipping peephole pass"
+            )
+            return self.report
+        self.frozen = self.find_frozen()
+
+        # Bounded so that cycles of jumps pointing at each other terminate
+        for _ in self.body:
+            changed = self.remove_redundant_loads()
+            changed |= self.thread_jumps()
+            changed |= self.remove_dead_stores()
+            if not changed:
+                break
+
+        self.relocate()
+        removed = self.report["redundant_load"] + self.report["jump_to_next"]
+        removed += self.report["dead_store"]
+        logger.info(f"Peephole pass: {self.report}")
+        logger.info(
+            f"Removed {removed} instructions ({2 * removed} bytes) and threaded "
+            f"{self.report['jump_threading']} jumps"
+        )
+        return self.report
+
+    def uses_absolute_addresses(self) -> bool:
+        start = self.assembler.file_start
+        end = start + self.assembler.file_len
+        for idx in self.body:
+            token = self.tokens[idx]
+            if not is_instruction(token) or token[0] in IMMEDIATE:
+                continue
+            if not is_symbolic(token[1]) and start <= int(token[1], 16) <= end:
+                return True
+        return False
+
+    def find_frozen(self) -> Set[int]:
+        # Anything written by MM or SC may be executed as code, so the
+        # instructions following such a symbol are left untouched.
+        flagged = set(self.self_modifying)
+        for idx in self.body:
+            token = self.tokens[idx]
+            if is_instruction(token) and token[0] in {MM, SC}:
+                flagged.add(token[1])
+
+        frozen = set()
+        in_region = False
+        for idx in self.body:
+            token = self.tokens[idx]
+            if is_label(token) or is_constant(token):
+                in_region = token[0] in flagged
+            elif is_instruction(token) and in_region:
+                frozen.add(idx)
+        return frozen
+
+    def next_token(self, idx: int) -> Optional[int]:
+        idx += 1
+        while idx in self.body and not self.tokens[idx]:
+            idx += 1
+        return idx if idx in self.body else None
+
+    def fall_through(self, idx: int) -> Optional[int]:
+        # Index of the next instruction executed after `idx`, if it is not data
+        idx = self.next_token(idx)
+        while idx is not None and not is_instruction(self.tokens[idx]):
+            if is_constant(self.tokens[idx]):
+                return None
+            idx = self.next_token(idx)
+        return idx
+
+    def label_target(self, name: str) -> Optional[int]:
+        for idx in self.body:
+            if is_label(self.tokens[idx]) and self.tokens[idx][0] == name:
+                return self.fall_through(idx)
+        return None
+
+    def removable(self, idx: int) -> bool:
+        # An instruction right before data stays, otherwise a label pointing
+        # at it would end up pointing at the data instead
+        return (
+            is_instruction(self.tokens[idx])
+            and idx not in self.frozen
+            and self.fall_through(idx) is not None
+        )
+
+    def remove(self, idx: int, reason: str):
+        logger.debug(f"{reason}: removing {self.tokens[idx]}")
+        self.tokens[idx] = []
+        self.report[reason] += 1
+
+    def remove_redundant_loads(self) -> bool:
+        # MM X ; LD X  and  LD X ; LD X  leave AC equal to memory[X] already
+        changed = False
+        for idx in self.body:
+            token = self.tokens[idx]
+            if not self.removable(idx) or token[0] not in {LD, MM}:
+                continue
+            following = self.next_token(idx)
+            if following is None or not self.removable(following):
+                continue
+            if self.tokens[following] == [LD, token[1]]:
+                self.remove(following, "redundant_load")
+                changed = True
+        return changed
+
+    def thread_jumps(self) -> bool:
+        changed = False
+        for idx in self.body:
+            token = self.tokens[idx]
+            if idx in self.frozen or not is_instruction(token) or token[0] not in JUMPS:
+                continue
+            if not is_symbolic(token[1]):
+                continue
+
+            target = self.label_target(token[1])
+            if target is None:
+                continue
+            if target == self.fall_through(idx) and self.removable(idx):
+                self.remove(idx, "jump_to_next")
+                changed = True
+                continue
+
+            target_token = self.tokens[target]
+            if (
+                target in self.frozen
+                or target_token[0] != JP
+                or not is_symbolic(target_token[1])
+                or target_token[1] == token[1]
+            ):
+                continue
+            logger.debug(f"jump_threading: {token} -> {target_token[1]}")
+            token[1] = target_token[1]
+            self.report["jump_threading"] += 1
+            changed = True
+        return changed
+
+    def remove_dead_stores(self) -> bool:
+        changed = False
+        executable = self.executable_symbols()
+        read = {
+            self.tokens[idx][1]
+            for idx in self.body
+            if is_instruction(self.tokens[idx]) and self.tokens[idx][0] != MM
+        }
+        constants = {
+            self.tokens[idx][0] for idx in self.body if is_constant(self.tokens[idx])
+        }
+        for idx in self.body:
+            token = self.tokens[idx]
+            if not self.removable(idx) or token[0] != MM:
+                continue
+            following = self.next_token(idx)
+            overwritten = (
+                following is not None
+                and following not in self.frozen
+                and self.tokens[following] == token
+            )
+            unused = (
+                self.drop_result_stores
+                and token[1] in constants
+                and token[1] not in read
+                and token[1] not in executable
+            )
+            if overwritten or unused:
+                self.remove(idx, "dead_store")
+                changed = True
+        return changed
+
+    def executable_symbols(self) -> Set[str]:
+        # Constants that may be run as code: reachable through a jump to a
+        # label in the same data block, or by falling through into the block.
+        targets = {
+            self.tokens[idx][1]
+            for idx in self.body
+            if is_instruction(self.tokens[idx]) and self.tokens[idx][0] in CONTROL
+        }
+        executable = set()
+        block: List[str] = []
+        reachable = False
+        terminated = False
+        for idx in self.body:
+            token = self.tokens[idx]
+            if is_instruction(token):
+                if reachable:
+                    executable.update(block)
+                block, reachable = [], False
+                terminated = is_terminator(token)
+            elif is_label(token) or is_constant(token):
+                if not block and is_constant(token):
+                    reachable = reachable or not terminated
+                if is_constant(token):
+                    block.append(token[0])
+                reachable = reachable or token[0] in targets
+        if reachable:
+            executable.update(block)
+        return executable
+
+    def relocate(self):
+        assembler = self.assembler
+        address = assembler.file_start
+        for idx in self.body:
+            token = self.tokens[idx]
+            if is_label(token) or is_constant(token):
+                assembler.symbols_table[token[0]] = address
+            if is_instruction(token):
+                address += 2
+            elif is_constant(token):
+                address += 1
+        assembler.file_len = address - assembler.file_start
+        assembler.file_end = address
@@ -3,8 +3,9 @@ from hypothesis import assume, given, settings
 from hypothesis.strategies import builds, integers, text
 from loguru import logger
 
+from src.counters import Counters
 from src.cpu import CPU
-from src.memory import Byte, Memory, Word
+from src.memory import BANK_SIZE, Byte, Memory, Word
 
 pytestmark = [pytest.mark.hypothesis]
 
@@ -219,3 +220,149 @@ def test_halt_machine(cpu, arg, module_mocker, user_input):
 
 def test_get_data(cpu):
     pass
+
+
+def test_get_data_mapped(tmp_path):
+    input_path = tmp_path / "data.bin"
+    input_path.write_bytes(bytearray([1, 200]))
+    cpu = CPU(Memory(), input_path=input_path, mapped_io=True)
+    values = []
+    for _ in range(3):
+        cpu.get_data()
+        values.append(cpu.AC.unsigned)
+    cpu.close()
+    assert values == [1, 200, 0]
+    assert cpu.memory.read_offset == 3
+
+
+def test_put_data_mapped(tmp_path):
+    output_path = tmp_path / "output.bin"
+    with CPU(
+        Memory(), mapped_io=True, binary_output_path=output_path, output_capacity=2
+    ) as cpu:
+        for value in [3, -1, 7, 0, 9]:
+            cpu.AC = value
+            cpu.put_data()
+    assert output_path.read_bytes() == bytearray([3, 255, 7, 0, 9])
+
+    # A second run appends, and the file is trimmed even if the guest fails
+    with pytest.raises(ZeroDivisionError):
+        with CPU(Memory(), mapped_io=True, binary_output_path=output_path) as cpu:
+            cpu.AC = 4
+            cpu.put_data()
+            cpu.memory[0x900] = Byte(0)
+            cpu.divide(0x900)
+    assert output_path.read_bytes() == bytearray([3, 255, 7, 0, 9, 4])
+
+
+def test_output_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        CPU(Memory(), mapped_io=True, output_capacity=0)
+
+
+def test_memory_banks():
+    memory = Memory(banks=2)
+    cpu = CPU(memory)
+    memory[0x900] = Byte(5)
+    memory[0x100] = Byte(6)
+    cpu.os_call(0x101)
+    assert memory.bank == 1
+    assert memory[0x900] == 0
+    assert memory[0x100] == 6
+    cpu.AC = -3
+    cpu.move_to_memory(0x900)
+    assert memory[0x900] == -3
+    assert memory[-0x700] == -3
+    memory[0x7FF:0x801] = [Byte(1), Byte(2)]
+    assert memory[0x7FF:0x801] == [1, 2]
+    assert memory[0x801] is memory[0x801]
+    cpu.os_call(0x100)
+    assert memory[0x900] == 5
+    assert memory[0x800] == 0
+    with pytest.raises(IndexError):
+        cpu.os_call(0x102)
+
+
+def test_map_banks_does_not_copy():
+    dataset = bytearray(range(256)) * 14
+    memory = Memory()
+    banks = memory.map_banks(dataset)
+    assert list(banks) == [1, 2]
+    memory.switch_bank(2)
+    assert memory[0x800].unsigned == BANK_SIZE & 0xFF
+    memory[0x801] = Byte(-1)
+    assert dataset[BANK_SIZE + 1] == 0xFF
+
+
+def test_bank_switch_from_code():
+    # Code at the standard /F00 origin switches banks under itself
+    program = [0xF1, 0x01, 0x30, 0x03, 0x99, 0x00, 0xF1, 0x00, 0x89, 0x00, 0xF0, 0x00]
+    memory = Memory(banks=2)
+    for idx, byte in enumerate(program):
+        memory[0xF00 + idx] = Byte(byte)
+    memory[0x900] = Byte(7)
+    cpu = CPU(memory)
+    cpu.PC = 0xF00
+    with pytest.raises(SystemExit):
+        while True:
+            cpu.fetch()
+            function, arg = cpu.decode()
+            function(arg)
+    assert cpu.PC == 0xF0C
+    assert cpu.AC == 7
+    assert memory.bank == 0
+    assert memory.banks[1][0x100] == 3
+
+
+def test_counters():
+    memory = Memory()
+    program = [0x30, 0x05, 0x99, 0x00, 0x89, 0x00, 0xF2, 0x00, 0xF3, 0x30]
+    for idx, byte in enumerate(program):
+        memory[0x100 + idx] = Byte(byte)
+    cpu = CPU(memory, counters=Counters())
+    cpu.PC = 0x100
+    cpu.step()
+    cpu.step()
+    cpu.step()
+    cpu.step()
+    assert cpu.AC == 3
+    cpu.step()
+    assert cpu.AC == 1
+    assert cpu.counters.memory_reads == 1
+    assert cpu.counters.memory_writes == 1
+    assert cpu.counters.opcodes[0xF] == 2
+    assert "vm_instructions_retired_total 5\n" in cpu.counters.prometheus()
+
+
+def test_counters_written_on_close(tmp_path):
+    metrics_path = tmp_path / "metrics.prom"
+    memory = Memory()
+    for idx, byte in enumerate([0x30, 0x05, 0xF0, 0x00]):
+        memory[0x100 + idx] = Byte(byte)
+    with CPU(memory, counters=Counters(), metrics_path=metrics_path) as cpu:
+        cpu.PC = 0x100
+        cpu.step()
+        with pytest.raises(SystemExit):
+            cpu.step()
+    assert "vm_instructions_retired_total 1\n" in metrics_path.read_text()
+
+
+@given(arg=integers(min_value=0, max_value=2046), PC=even_positions)
+def test_shadow_return(arg, PC):
+    cpu = CPU(Memory(), shadow_stack=True, counters=Counters())
+    cpu.PC = PC
+    cpu.subroutine_call(arg)
+    cpu.return_from_subroutine(arg)
+    assert cpu.PC == PC & 0xFFF
+    assert cpu.counters.return_hits == 1
+
+
+def test_shadow_return_modified_by_guest():
+    cpu = CPU(Memory(), shadow_stack=True, counters=Counters())
+    cpu.PC = 0x120
+    cpu.subroutine_call(0x300)
+    cpu.memory[0x301] = Byte(0x40)
+    cpu.return_from_subroutine(0x300)
+    assert cpu.PC == 0x140
+    assert cpu.counters.return_misses == 1
+    assert not cpu.return_stack
@@ -0,0 +1,100 @@
+import importlib.resources
+
+import pytest
+
+from src import data
+from src.assembler import Assembler
+from src.benchmark import assemble as assemble_file
+from src.benchmark import count_instructions
+
+
+@pytest.fixture
+def assemble(tmp_path):
+    def _assemble(source):
+        path = tmp_path / "program.asm"
+        path.write_text(source)
+        assembler = Assembler(path)
+        assembler.step_one()
+        return assembler
+
+    return _assemble
+
+
+def instructions(assembler):
+    return [token for token in assembler.tokens if len(token) == 2]
+
+
+def test_redundant_load(assemble):
+    ass = assemble(
+        "@ /100\nLD X\nMM TEMP\nLD TEMP\n+ TEMP\nPD 0\nOS 0\nX K 1\nTEMP K 0\n#\n"
+    )
+    report = ass.optimize()
+    assert report["redundant_load"] == 1
+    assert ["8", "TEMP"] not in instructions(ass)
+    assert ass.symbols_table["X"] == 0x100 + 10
+    assert ass.file_len == 12
+
+
+def test_jump_threading(assemble):
+    ass = assemble(
+        "@ /100\nLD X\nJZ FIRST\nPD 0\nOS 0\nFIRST\nJP SECOND\nSECOND\nPD 0\nOS 0\nX K 0\n#\n"
+    )
+    report = ass.optimize()
+    assert report["jump_threading"] == 1
+    assert report["jump_to_next"] == 1
+    assert ["1", "SECOND"] in instructions(ass)
+    assert ass.symbols_table["FIRST"] == ass.symbols_table["SECOND"]
+
+
+def test_dead_store(assemble):
+    ass = assemble("@ /100\nLD X\nMM Y\nMM Y\nPD 0\nOS 0\nX K 1\nY K 0\n#\n")
+    report = ass.optimize()
+    assert report["dead_store"] == 1
+    assert instructions(ass).count(["9", "Y"]) == 1
+
+
+def test_result_store_is_kept(assemble):
+    source = "@ /100\nLD X\n+ X\nMM RESULT\nOS 0\nX K 1\nRESULT K 0\n#\n"
+    ass = assemble(source)
+    assert ass.optimize()["dead_store"] == 0
+    assert ["9", "RESULT"] in instructions(ass)
+
+    ass = assemble(source)
+    assert ass.optimize(drop_result_stores=True)["dead_store"] == 1
+
+
+def test_comment_after_end(assemble):
+    ass = assemble(
+        "@ /100\nLD X\nMM Y\nMM Y\nOS 0\nX K 1\nY K 0\n#\n; trailing comment\n"
+    )
+    assert ass.optimize()["dead_store"] == 1
+    assert ass.tokens[ass.end_index] == ["0", "100"]
+
+
+def test_executed_data_is_kept(assemble):
+    # Same shape as the end of loader.asm: GOAL is written and then run as a jump
+    ass = assemble(
+        "@ /100\nGD 0\nMM GOAL\nJP FINISH\nFINISH\nGOAL K 0\nGOAL_TWO K 0\n#\n"
+    )
+    report = ass.optimize()
+    assert report["dead_store"] == 0
+
+
+def test_data_after_os_call_is_kept(assemble):
+    # Only OS 0 stops the machine, any other call falls through into D
+    ass = assemble("@ /100\nLD X\nMM D\nOS /101\nD K 0\nX K 1\n#\n")
+    assert ass.optimize(drop_result_stores=True)["dead_store"] == 0
+
+
+def test_self_modifying_region_is_kept(assemble):
+    ass = assemble("@ /100\nLD X\nJP PATCH\nPATCH\nMM X\nLD X\nOS 0\nX K 1\n#\n")
+    report = ass.optimize(self_modifying=["PATCH"])
+    assert report["redundant_load"] == 0
+    assert instructions(ass).count(["8", "X"]) == 2
+
+
+def test_benchmark_runs_fewer_instructions():
+    with importlib.resources.path(data, "benchmark.asm") as path:
+        before = count_instructions(assemble_file(path))
+        after = count_instructions(assemble_file(path, optimize=True))
+    assert after < before
@@ -0,0 +1,40 @@
+import importlib.resources
+
+import pytest
+
+from src import data
+from src.bulk import load_images, verify_images
+from src.memory import Byte, Memory
+
+
+@pytest.fixture(scope="module")
+def image():
+    return importlib.resources.read_binary(data, "program.bin")
+
+
+def test_verify_images(image):
+    corrupted = bytearray(image)
+    corrupted[10] ^= 1
+    truncated = image[:-1]
+    result = verify_images([image, bytes(corrupted), truncated, b"", image])
+    assert result.tolist() == [True, False, False, False, True]
+
+
+def test_load_images(image):
+    first, second = load_images([image, image])
+    assert first.start == 0xF00
+    assert first.length == image[2]
+    assert [
+        byte.unsigned for byte in first.memory[0xF00 : 0xF00 + first.length]
+    ] == list(image[4:-2])
+    assert first.memory[:59] == Memory()[:59]
+
+    first.memory[0xF00] = Byte(0)
+    assert second.memory[0xF00].unsigned == image[4]
+
+
+def test_load_images_rejects_bad_checksum(image):
+    corrupted = bytearray(image)
+    corrupted[3] ^= 1
+    with pytest.raises(ValueError):
+        load_images([image, bytes(corrupted)])
@@ -0,0 +1,56 @@
+import random
+
+import attr
+import pytest
+
+from src import difftest
+from src.difftest import Program, check_many, compare, encode, generate, shrink
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_fast_matches_reference(seed):
+    program = generate(random.Random(seed))
+    assert compare(program, ["reference", "fast"], 200) is None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_mapped_io_matches_reference(seed):
+    program = generate(random.Random(seed))
+    assert compare(program, ["reference", "mapped"], 200) is None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_shadow_matches_reference(seed):
+    program = generate(random.Random(seed))
+    assert compare(program, ["reference", "shadow"], 200) is None
+
+
+def test_encode_round_trip():
+    # JP /1A0: the low byte is negative once read back as a signed Byte
+    program = Program([encode(0x0, 0x1A0)])
+    assert difftest.run_reference(program, 1).PC == 0x1A0
+
+
+def test_check_many_in_pool():
+    assert check_many(range(20), ["reference", "fast"], workers=2) == []
+
+
+def test_shrink(monkeypatch):
+    def run_broken(program, max_steps):
+        outcome = difftest.run_fast(program, max_steps)
+        if any(word >> 12 == 0xE for word in program.words):
+            outcome = attr.evolve(outcome, output=outcome.output + "!")
+        return outcome
+
+    monkeypatch.setitem(difftest.ENGINES, "broken", run_broken)
+    program = Program(
+        [encode(0x3, 7), encode(0xD, 0), encode(0xE, 0), encode(0x4, 0x120)],
+        data=b"\x01\x02",
+        scratch=b"\x05" * 16,
+    )
+    divergence = compare(program, ["fast", "broken"], 100)
+    assert divergence is not None
+
+    minimal = shrink(divergence, ["fast", "broken"], 100).program
+    assert minimal.size() == (3, 1, 0, 0)
+    assert minimal.words[-1] == encode(0xE, 0)